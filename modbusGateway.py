@@ -1,15 +1,28 @@
+import array
+import asyncio
+import ctypes
+import os
+import selectors
+import socket
+import struct
 import threading
 import time
 import sys
+from multiprocessing.shared_memory import SharedMemory
+
+import serial
 
 # --- IMPORT HANDLING ---
 
 # Newer Pymodbus versions (3.x)
-from pymodbus.client import ModbusTcpClient
-from pymodbus.server import (StartSerialServer,StartTcpServer)
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.server import (StartSerialServer,ModbusTcpServer)
 from pymodbus import (FramerType,ModbusException,pymodbus_apply_logging_config)
+from pymodbus.framer import FramerRTU
 from pymodbus.datastore import ModbusSequentialDataBlock, ModbusSlaveContext, ModbusServerContext
+from pymodbus.exceptions import ModbusIOException
 from pymodbus.pdu import ExceptionResponse
+from pymodbus.pdu.register_message import ReadHoldingRegistersResponse, WriteMultipleRegistersRequest
 
 # Debugging threads requre debugpy lib
 try:
@@ -22,6 +35,9 @@ except:
 # Toggle extended console output for debugging
 DEBUG_MSG = False
 
+# Optional native CRC-16 for the RTU framer, built from crc16_modbus.c
+CRC_LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crc16_modbus.so")
+
 # =================================================================
 # --- CONFIGURATION ---
 # =================================================================
@@ -29,6 +45,10 @@ DEBUG_MSG = False
 # Fixed timeout for stale data
 DATA_STALE_TIMEOUT    = 1.0 
 
+# Optional POSIX shared memory segment (/dev/shm/<name>) exposing the register
+# buffers to other local processes, e.g. "ksem_regs". None keeps them private.
+SHARED_MEMORY_NAME   = None
+
 # TCP Server Settings (Receiving pushed data from the KSEM master)
 TCP_LISTENING_IP     = "192.168.178.150"
 TCP_LISTENING_PORT   = 5020
@@ -38,6 +58,11 @@ TCP_POLLING_IP       = "192.168.178.100"
 TCP_POLLING_PORT     = 502
 TCP_POLLING_TIMEOUT  = 5.0
 TCP_POLLING_INTERVAL = 2
+# Dead peer detection by the OS (TCP keepalive), instead of checking the connection every cycle
+TCP_KEEPALIVE_IDLE     = 2      # seconds without traffic before the first probe
+TCP_KEEPALIVE_INTERVAL = 1      # seconds between probes
+TCP_KEEPALIVE_COUNT    = 3      # unanswered probes until the connection is dropped
+TCP_USER_TIMEOUT       = 3000   # ms unacknowledged data may stay in flight
 
 # RTU Settings (Serving data to the Inverter via RS485)
 SERIAL_PORT     = "/dev/ttyACM0"
@@ -47,6 +72,19 @@ STOPBITS        = 2
 BYTESIZE        = 8
 RTU_SLAVE_ID    = 1
 
+# Serve the inverter with the built-in minimal RTU responder (read holding registers only).
+# Set to False to fall back to the generic pymodbus serial server.
+RTU_NATIVE_RESPONDER = True
+# Line silence that terminates a frame which is not a complete read request
+RTU_FRAME_GAP        = 0.004
+
+# Scheduling (Linux): pin the RTU side to its own CPU core (ideally isolated with the
+# isolcpus=3 kernel parameter) and run it with real-time priority (SCHED_FIFO) to avoid
+# serial timing jitter. Requires root or CAP_SYS_NICE. None disables the setting.
+RTU_CPU_CORE         = 3
+RTU_RT_PRIORITY      = 50
+NETWORK_CPU_CORE     = 0
+
 
 # --- KOSTAL KSEM REGISTER RANGE CONFIGURATION ---
 # Format: (Modbus_Start_Address, Register_Count, Target_Memory_Offset)
@@ -55,14 +93,15 @@ RTU_SLAVE_ID    = 1
 POLLING_TASKS = [
     # --- GROUP 1: Instantaneous Values (Totals & Phase Values) ---
     # Range: 0 to 147 (Total: 148)
-    # (0, 100, 1),                # Part A: Indices 0-99 -> Memory 1
-    # (100, 48, 101),             # Part B: Indices 100-147 -> Memory 101
+    # (0, 125, 1),                # Part A: Indices 0-124 -> Memory 1 (max. 125 per request)
+    # (125, 23, 126),             # Part B: Indices 125-147 -> Memory 126
 
     # --- GROUP 2: Internal Energy Values (Counters) ---
     # Range: 512 to 791 (Total: 280)
-    (512, 100, 513),             # Part A: Indices 512-611 -> Memory 513
-    (612, 100, 613),             # Part B: Indices 612-711 -> Memory 613
-    (712, 80, 713),              # Part C: Indices 712-791 -> Memory 713
+    # Largest requests (max. 125 registers) that keep the 4-register (uint64) counter grid
+    (512, 124, 513),             # Part A: Indices 512-635 -> Memory 513
+    (636, 124, 637),             # Part B: Indices 636-759 -> Memory 637
+    (760, 32, 761),              # Part C: Indices 760-791 -> Memory 761
 
     # --- GROUP 3: KSEM / RM PnP Management ---
     # Size: 57 Registers (8192 to 8248)
@@ -77,84 +116,517 @@ def debug_message(msg: str):
         print(msg)
 
 
+def install_native_crc():
+    # Replace pymodbus' pure Python CRC-16 (one table lookup per byte) with the C version
+    try:
+        lib = ctypes.CDLL(CRC_LIBRARY)
+    except OSError:
+        print("[main] crc16_modbus.so not found, using pymodbus CRC")
+        return
+
+    crc16 = lib.crc16_modbus
+    crc16.argtypes = (ctypes.c_char_p, ctypes.c_size_t)
+    crc16.restype = ctypes.c_uint16
+
+    def compute_CRC(cls, data):
+        # pymodbus expects the CRC byte-swapped (first byte on the wire in the high byte)
+        crc = crc16(bytes(data), len(data))
+        return ((crc << 8) & 0xFF00) | (crc >> 8)
+
+    FramerRTU.compute_CRC = classmethod(compute_CRC)
+
+
+def to_wire_order(values) -> array.array:
+    # Converts register values to unsigned 16-bit words in Modbus (big-endian) byte order
+    words = array.array('H', values)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+class RawReadHoldingRegistersResponse(ReadHoldingRegistersResponse):
+    # Read Holding Registers response that keeps the payload as raw big-endian bytes
+    # (self.payload) instead of unpacking every register into a Python int
+    def decode(self, data: bytes) -> None:
+        if (byte_count := data[0]) >= len(data):
+            raise ModbusIOException(f"byte_count {byte_count} > length of packet {len(data)}")
+        self.payload = memoryview(data)[1:1 + byte_count]
+        self.registers = []
+
+
+class RawWriteMultipleRegistersRequest(WriteMultipleRegistersRequest):
+    # Write Multiple Registers request (KSEM push) that hands the register data to the
+    # datastore as raw big-endian bytes instead of a list of per-register ints
+    def decode(self, data: bytes) -> None:
+        self.address, self.count, _byte_count = struct.unpack(">HHB", data[:5])
+        self.registers = memoryview(data)[5:5 + 2 * self.count]
+        if len(self.registers) != 2 * self.count:
+            raise ModbusIOException(f"register data {len(self.registers)} bytes, expected {2 * self.count}")
+
+
+def open_shared_registers(name: str, count: int):
+    # Maps both register buffers into one shared memory segment.
+    # Layout (unsigned 16-bit words): [buffer 0 | buffer 1 | index of the active buffer | update counter]
+    size = 2 * (2 * count + 2)
+    try:
+        shm = SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # Segment left over from a previous run: reuse it if it is large enough
+        shm = SharedMemory(name=name)
+        if shm.size < size:
+            shm.close()
+            shm.unlink()
+            shm = SharedMemory(name=name, create=True, size=size)
+
+    return shm, shm.buf.cast('H')
+
+
 class SharedDataBlock(ModbusSequentialDataBlock):
-    def __init__(self, address, values):
+    # Max. number of cached (address, count) read responses and RTU frames
+    CACHE_SIZE = 64
+
+    def __init__(self, address, values, shared_memory_name=None):
         # Thread-safe data block for sharing registers between TCP and RTU interfaces
         super().__init__(address, values)
-        self.data_lock = threading.Lock()
+        # Double-buffered register store (unsigned 16-bit, 2 bytes per register):
+        # readers always use the active buffer (self.values), writers fill the
+        # shadow buffer and publish it with a single reference swap.
+        # Registers are kept in wire (big-endian) byte order, so RTU payloads are a plain copy
+        initial = to_wire_order(self.values)
+        if shared_memory_name:
+            # Both buffers live in shared memory; the trailing words tell other
+            # processes which one is active and count the published updates
+            count = len(initial)
+            self.shm, self._shm_words = open_shared_registers(shared_memory_name, count)
+            self.values = self._shm_words[:count]
+            self._shadow = self._shm_words[count:2 * count]
+            self._shm_active = self._shm_words[2 * count:2 * count + 1]
+            self._shm_seq = self._shm_words[2 * count + 1:2 * count + 2]
+            self.values[:] = initial
+            self._shm_active[0] = 0
+            self._shm_seq[0] = 0
+        else:
+            self.shm = None
+            self.values = initial
+            self._shadow = array.array('H', initial)
+        # The register space never changes size: precompute its end for validate()
+        self._end = self.address + len(initial)
+        # Serializes the writers (TCP polling worker and TCP server) only
+        self.write_lock = threading.Lock()
         self.timestamp = 0.0
+        # Revision counter bumped on every published update, and the read responses
+        # built from it: {(address, count): (revision, values)}
+        self._rev = 0
+        self._cache = {}
+        # Complete RTU response frames {(address, count): frame}, kept until a write overlaps them
+        self._frame_cache = {}
+
+    def close(self):
+        # Unmap and remove the shared memory segment (no-op for private buffers)
+        if self.shm:
+            for view in (self.values, self._shadow, self._shm_active, self._shm_seq, self._shm_words):
+                view.release()
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
 
     @classmethod
     def create(cls):
         super().create()
 
+    def __iter__(self):
+        # (address, value) pairs in host byte order, like the base class yields for its list
+        words = array.array('H', self.values)
+        if sys.byteorder == 'little':
+            words.byteswap()
+        return enumerate(words, self.address)
+
+    def reset(self):
+        # Reset all registers to the default value in place, so the typed (and shared)
+        # buffers stay in use; the data counts as stale until the next real update
+        self.setBlocks([(self.address, [self.default_value] * len(self.values))])
+        self.timestamp = 0.0
+
+    def validate(self, address, count=1):
+        # Single range check against the fixed size flat register space
+        return self.address <= address and address + count <= self._end
+
+    def _data_stale(self) -> bool:
+        # Check if the important push data is stale
+        if (time.time() - self.timestamp) > DATA_STALE_TIMEOUT:
+            print(f"[Warning] Push data stale! Last seen: {round(time.time() - self.timestamp, 2)}s ago")
+            return True
+        return False
+
+    def _read_registers(self, address, count):
+        # Copy of a register range in wire byte order plus the revision it belongs to.
+        # Once an update is published, the buffer a reader holds becomes the writers' shadow,
+        # so a copy that overlapped a publish may mix two updates: retry until none did
+        start = address - self.address
+        while True:
+            rev = self._rev
+            data = self.values[start:start + count].tobytes()
+            if self._rev == rev:
+                return rev, data
+
     def getValues(self, address, count=1):
-        # Safe read access for the RTU server with offset logging
-        with self.data_lock:
-            # Check if the important push data is stale
-            if (time.time() - self.timestamp) > DATA_STALE_TIMEOUT:
-                # Data is too old. Return Slave Device Failure (0x04)
-                # This informs the RS485 Master that communication is broken
-                print(f"[Warning] Push data stale! Last seen: {round(time.time() - self.timestamp, 2)}s ago")
-                return ExceptionResponse.SLAVE_FAILURE
-            
-            # Use base class logic for data retrieval and error checking
-            values = super().getValues(address, count)
-            
+        # Lock-free read access for the RTU server with offset logging
+        if self._data_stale():
+            # Data is too old. Return Slave Device Failure (0x04)
+            # This informs the RS485 Master that communication is broken
+            return ExceptionResponse.SLAVE_FAILURE
+
+        # Inverters re-read the same windows: reuse the last response if nothing changed since
+        key = (address, count)
+        entry = self._cache.get(key)
+        if entry and entry[0] == self._rev:
+            values = entry[1]
+        else:
+            # Convert the raw registers to host byte order in one batch and hand pymodbus a plain list
+            rev, data = self._read_registers(address, count)
+            words = array.array('H')
+            words.frombytes(data)
+            if sys.byteorder == 'little':
+                words.byteswap()
+            values = words.tolist()
+
+            # FIFO eviction of the oldest request pattern
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.pop(next(iter(self._cache)), None)
+            self._cache[key] = (rev, values)
+
         # Logging the RTU request (Note: StartSerialServer might shift address internally)
-        debug_message(f"--> [RTU ANFRAGE] Inverter liest Adr: {address-1}, Anzahl: {count}")
-        debug_message(f"<-- [RTU ANTWORT] Daten gesendet: {values}")
+        # Guarded here so the f-strings are not even built when debugging is off
+        if DEBUG_MSG:
+            print(f"--> [RTU ANFRAGE] Inverter liest Adr: {address-1}, Anzahl: {count}")
+            print(f"<-- [RTU ANTWORT] Daten gesendet: {values}")
         
         return values
 
+    def getFrame(self, address, count, build_frame):
+        # Complete response frame for the RTU responder. On a miss build_frame() turns the raw
+        # big-endian register bytes (one copy, no int conversion) into the frame, which is then
+        # reused until a write touches the range. Returns Slave Device Failure if data is stale
+        if self._data_stale():
+            return ExceptionResponse.SLAVE_FAILURE
+
+        if DEBUG_MSG:
+            print(f"--> [RTU ANFRAGE] Inverter liest Adr: {address-1}, Anzahl: {count}")
+
+        key = (address, count)
+        frame = self._frame_cache.get(key)
+        if frame is None:
+            rev, data = self._read_registers(address, count)
+            frame = build_frame(data)
+
+            # Writers publish and invalidate under the write lock: only store the frame if
+            # no write happened since the read, and never wait for a writer here
+            if self.write_lock.acquire(blocking=False):
+                try:
+                    if self._rev == rev:
+                        if len(self._frame_cache) >= self.CACHE_SIZE:
+                            self._frame_cache.pop(next(iter(self._frame_cache)))
+                        self._frame_cache[key] = frame
+                finally:
+                    self.write_lock.release()
+
+        return frame
+
     def setValues(self, address, values):
         # Safe write access for the TCP polling worker/server
-        with self.data_lock:
-            # Update the underlying data store
-            super().setValues(address, values)
+        # values: list of register ints or raw big-endian register bytes (see setBlocks)
+        if not isinstance(values, (list, bytes, bytearray, memoryview)):
+            values = [values]
+        self.setBlocks([(address, values)])
+
+        if DEBUG_MSG:
+            data = values if isinstance(values, list) else bytes(values).hex(' ')
+            print(f"--> [TCP INPUT] Inverter writes Adr: {address-1}, Data: {data}")
+
+    def setBlocks(self, blocks):
+        # Apply several (address, values) updates and publish them with a single buffer swap.
+        # values is either a list of register ints or raw big-endian register bytes
+        with self.write_lock:
+            # Bring the shadow buffer up to date (memmove), then apply the partial updates
+            shadow = self._shadow
+            shadow[:] = self.values
+            written = []
+            for address, values in blocks:
+                start = address - self.address
+                if isinstance(values, (bytes, bytearray, memoryview)):
+                    # Already in wire order: copy the bytes as they are
+                    with memoryview(shadow).cast('B') as raw:
+                        raw[2 * start:2 * start + len(values)] = values
+                    written.append((address, address + len(values) // 2))
+                else:
+                    shadow[start:start + len(values)] = to_wire_order(values)
+                    written.append((address, address + len(values)))
+
+            # Publish the updated buffer; readers pick it up on their next access
+            self._shadow = self.values
+            self.values = shadow
+            if self.shm:
+                self._shm_active[0] ^= 1
+                self._shm_seq[0] = (self._shm_seq[0] + 1) & 0xFFFF
+            self._rev += 1
             self.timestamp = time.time()
 
-        debug_message(f"--> [TCP INPUT] Inverter writes Adr: {address-1}, Data: {values}")
+            # Drop the RTU frames overlapping the written ranges
+            for key in list(self._frame_cache):
+                first, count = key
+                if any(first < end and begin < first + count for begin, end in written):
+                    del self._frame_cache[key]
+
+async def poll_once(client: AsyncModbusTcpClient, data_block: SharedDataBlock, rejected: set):
+    # Queue all polling requests at once. pymodbus 3.8 still sends them one after the other on
+    # this single connection (its transaction manager holds a lock per request), so the cycle
+    # time is the sum of the round trips; a second KSEM connection is deliberately avoided
+    results = await asyncio.gather(
+        *(client.read_holding_registers(address=start, count=count, slave=1) for start, count, _ in POLLING_TASKS),
+        return_exceptions=True,
+    )
+
+    # Collect all blocks first, then publish them to the RTU side in one update
+    blocks = []
+    errors = []
+    for (start, count, offset), res in zip(POLLING_TASKS, results):
+        if isinstance(res, Exception):
+            errors.append(res)
+        elif res and res.isError():
+            # Rejected by the KSEM (exception response): only log when a block starts failing
+            if start not in rejected:
+                rejected.add(start)
+                print(f"[TCP] KSEM rejected read of {count} registers at {start} (exception code {res.exception_code})")
+        elif res:
+            if start in rejected:
+                rejected.discard(start)
+                print(f"[TCP] KSEM accepts read of {count} registers at {start} again")
+            blocks.append((offset, res.payload))
+
+    if blocks:
+        data_block.setBlocks(blocks)
+    if errors:
+        raise errors[0]
+
+
+def enable_tcp_keepalive(client: AsyncModbusTcpClient):
+    # Let the kernel detect a dead KSEM connection; a failing read then triggers the reconnect
+    transport = client.ctx.transport
+    if transport is None:
+        # Connection dropped right after connect; the next read fails and reconnects
+        return
+
+    sock = transport.get_extra_info('socket')
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, TCP_KEEPALIVE_INTERVAL)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, TCP_KEEPALIVE_COUNT)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, TCP_USER_TIMEOUT)
+
+
+async def connect_polling_client(client: AsyncModbusTcpClient) -> bool:
+    # Single (re)connect attempt to the KSEM; enables keepalive on the new socket
+    client.close()
+    if not await client.connect():
+        return False
+
+    try:
+        enable_tcp_keepalive(client)
+    except Exception as e:
+        print(f"[TCP] Could not enable keepalive: {e}")
+    return True
 
-def tcp_poll_worker(data_block: SharedDataBlock):
-    # High-priority background thread for active Modbus TCP polling
-    client = ModbusTcpClient(TCP_POLLING_IP, port=TCP_POLLING_PORT, timeout=TCP_POLLING_TIMEOUT)
+
+async def tcp_poll_worker(data_block: SharedDataBlock):
+    # High-priority background task for active Modbus TCP polling
+    # Reconnects are handled by this loop, so the client's own auto-reconnect is disabled
+    client = AsyncModbusTcpClient(TCP_POLLING_IP, port=TCP_POLLING_PORT, timeout=TCP_POLLING_TIMEOUT, reconnect_delay=0)
     
+    # Hand the raw register bytes to the data block instead of per-register ints
+    client.register(RawReadHoldingRegistersResponse)
+
     debug_message(f"[TCP] Priorisiertes Polling gestartet: {TCP_POLLING_IP}")
-    
+
+    # Connecting happens inside the try below, so no error can end the worker
+    need_connect = True
+    # Start addresses of the blocks the KSEM currently answers with an exception response
+    rejected = set()
+
     while True:
         try:
-            if not client.connected:
-                if not client.connect():
-                    time.sleep(5)
+            if need_connect:
+                if not await connect_polling_client(client):
+                    await asyncio.sleep(5)
                     continue
-            
-            for start, count, offset in POLLING_TASKS:
-                res = client.read_holding_registers(address=start, count=count, slave=1)
-                if res and not res.isError():
-                    data_block.setValues(offset, res.registers)
+                need_connect = False
+
+            await poll_once(client, data_block, rejected)
+
+        except (ModbusException, OSError) as e:
+            # Lost or unresponsive connection: only now reconnect
+            print(f"[TCP] Connection error in priority worker: {e}")
+            need_connect = True
 
         except Exception as e:
             print(f"[TCP] Error in priority worker: {e}")
             
-        time.sleep(TCP_POLLING_INTERVAL)
+        await asyncio.sleep(TCP_POLLING_INTERVAL)
 
 
-def run_tcp_server(data_block: SharedDataBlock):
+async def run_tcp_server(context: ModbusServerContext):
     # Secondary interface: Acts as a TCP Server to receive pushed data from masters
-    store   = ModbusSlaveContext(hr=data_block)
-    # Support both specific RTU ID and Broadcast/Standard IDs
-    context = ModbusServerContext(slaves={RTU_SLAVE_ID: store, 255: store}, single=False)
-
     print(f"[TCP Server] Listening for pushes on {TCP_LISTENING_IP}:{TCP_LISTENING_PORT}...")
-    StartTcpServer(context=context, address=(TCP_LISTENING_IP, TCP_LISTENING_PORT))
+    try:
+        # Pushed register data is copied into the data block as raw bytes
+        server = ModbusTcpServer(
+            context,
+            custom_pdu=[RawWriteMultipleRegistersRequest],
+            address=(TCP_LISTENING_IP, TCP_LISTENING_PORT),
+        )
+        # serve_forever() would wait forever after a failed bind; fail so the task gets restarted
+        if not await server.listen():
+            raise OSError("could not bind listening socket")
+        await server.serving
+    except Exception as e:
+        # Keep polling alive even if the push interface fails
+        print(f"[TCP Server] Critical error on {TCP_LISTENING_IP}:{TCP_LISTENING_PORT}: {e}")
+
+
+async def run_supervised(name: str, start_task):
+    # Restarts a network task whenever it ends, so one failing task cannot stop the other
+    while True:
+        try:
+            await start_task()
+            print(f"[{name}] Task ended, restarting in 5s")
+        except Exception as e:
+            print(f"[{name}] Task crashed: {e}, restarting in 5s")
+        await asyncio.sleep(5)
+
+
+def set_thread_scheduling(name: str, cpu_core=None, rt_priority=None):
+    # Pins the calling thread to one CPU core and optionally switches it to SCHED_FIFO
+    if cpu_core is not None:
+        try:
+            os.sched_setaffinity(0, {cpu_core})
+        except OSError as e:
+            print(f"[{name}] Could not pin thread to CPU {cpu_core}: {e}")
+
+    if rt_priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_priority))
+        except OSError as e:
+            print(f"[{name}] Could not set real-time priority {rt_priority}: {e}")
+
+
+def run_network_thread(data_block: SharedDataBlock, context: ModbusServerContext):
+    # KSEM polling and the push server share one asyncio event loop on a single thread
+    set_thread_scheduling("TCP", cpu_core=NETWORK_CPU_CORE)
+
+    async def network_main():
+        await asyncio.gather(
+            run_supervised("TCP", lambda: tcp_poll_worker(data_block)),
+            run_supervised("TCP Server", lambda: run_tcp_server(context)),
+        )
+
+    try:
+        asyncio.run(network_main())
+    except BaseException as e:
+        print(f"[TCP] Network loop failed: {e}")
+    finally:
+        # Without the network loop the RTU side would only answer with stale data errors;
+        # exit the whole process so systemd restarts the gateway
+        print("[TCP] Network loop ended, exiting")
+        os._exit(1)
+
+
+def rtu_crc_ok(frame) -> bool:
+    # Checks the trailing CRC of an RTU frame (uses the native CRC if installed)
+    return len(frame) >= 4 and FramerRTU.compute_CRC(frame[:-2]) == int.from_bytes(frame[-2:], 'big')
+
+
+def rtu_frame(pdu: bytes) -> bytes:
+    # Appends the CRC to slave id + PDU
+    return pdu + FramerRTU.compute_CRC(pdu).to_bytes(2, 'big')
+
+
+def ends_with_read_request(frame) -> bool:
+    # True if the last 8 bytes are a read request for us (slave id, FC 3, valid CRC).
+    # Checking only the tail resyncs on leading junk, e.g. a 0x00 at RS485 turnaround
+    return len(frame) >= 8 and frame[-8] == RTU_SLAVE_ID and frame[-7] == 3 and rtu_crc_ok(frame[-8:])
+
+
+def read_rtu_request(port: serial.Serial, sel: selectors.BaseSelector) -> bytearray:
+    # Blocks until the next frame arrives. A read request for us is returned as soon
+    # as it is complete, anything else once the line has been quiet for RTU_FRAME_GAP
+    sel.select()
+    frame = bytearray()
+    while True:
+        frame += port.read(port.in_waiting or 1)
+        if ends_with_read_request(frame):
+            return frame
+        if not sel.select(RTU_FRAME_GAP):
+            return frame
+
+
+def build_read_response(payload: bytes) -> bytes:
+    # Read Holding Registers response frame around the raw register bytes
+    return rtu_frame(bytes((RTU_SLAVE_ID, 3, len(payload))) + payload)
 
 
-def run_rtu_server(data_block: SharedDataBlock):
+def handle_rtu_request(data_block: SharedDataBlock, frame: bytearray):
+    # Builds the response for one request frame, or None if it is not meant for us
+    if ends_with_read_request(frame):
+        frame = frame[-8:]
+    elif not rtu_crc_ok(frame) or frame[0] != RTU_SLAVE_ID:
+        return None
+
+    function_code = frame[1]
+    if function_code != 3 or len(frame) != 8:
+        return rtu_frame(bytes((RTU_SLAVE_ID, function_code | 0x80, ExceptionResponse.ILLEGAL_FUNCTION)))
+
+    address, count = struct.unpack_from('>HH', frame, 2)
+    if not 1 <= count <= 125:
+        return rtu_frame(bytes((RTU_SLAVE_ID, 0x83, ExceptionResponse.ILLEGAL_VALUE)))
+
+    # Same +1 address shift as pymodbus' ModbusSlaveContext
+    if not data_block.validate(address + 1, count):
+        return rtu_frame(bytes((RTU_SLAVE_ID, 0x83, ExceptionResponse.ILLEGAL_ADDRESS)))
+
+    response = data_block.getFrame(address + 1, count, build_read_response)
+    if not isinstance(response, bytes):
+        # Stale push data: report Slave Device Failure
+        return rtu_frame(bytes((RTU_SLAVE_ID, 0x83, response)))
+
+    return response
+
+
+def run_rtu_responder(data_block: SharedDataBlock):
+    # Minimal RTU slave: one slave id, function code 3 only, served straight from the data block
+    port = serial.Serial(SERIAL_PORT, baudrate=BAUDRATE, parity=PARITY, stopbits=STOPBITS, bytesize=BYTESIZE, timeout=0)
+    port.reset_input_buffer()
+
+    sel = selectors.DefaultSelector()
+    sel.register(port, selectors.EVENT_READ)
+
+    while True:
+        response = handle_rtu_request(data_block, read_rtu_request(port, sel))
+        if response:
+            port.write(response)
+
+
+def run_rtu_server(data_block: SharedDataBlock, context: ModbusServerContext):
     # Main interface: Serves RTU requests to the Inverter via RS485
-    store = ModbusSlaveContext(hr=data_block)
-    context = ModbusServerContext(slaves={RTU_SLAVE_ID: store}, single=False)
-    
+    set_thread_scheduling("RTU", cpu_core=RTU_CPU_CORE, rt_priority=RTU_RT_PRIORITY)
+
+    if RTU_NATIVE_RESPONDER:
+        print(f"[RTU Responder] Active on {SERIAL_PORT} (38400, 8N2)")
+        try:
+            run_rtu_responder(data_block)
+        except Exception as e:
+            print(f"[RTU] Critical error on {SERIAL_PORT}: {e}")
+            sys.exit(1)
+        return
+
     print(f"[RTU Server] Active on {SERIAL_PORT} (38400, 8N2)")
 
     try:
@@ -172,22 +644,27 @@ def run_rtu_server(data_block: SharedDataBlock):
         sys.exit(1)
 
 if __name__ == "__main__":
+    install_native_crc()
+
     # Initialize memory for the full 16-bit address space (0x0000 to 0xFFFF)
-    shared_block = SharedDataBlock(0, [0] * 65536)
+    shared_block = SharedDataBlock(0, [0] * 65536, shared_memory_name=SHARED_MEMORY_NAME)
 
-    # 1. Start Polling Thread (Active polling of KSEM)
-    t_poll = threading.Thread(target=tcp_poll_worker, args=(shared_block,), daemon=True)
-    t_poll.start()
+    # One server context shared by the TCP and RTU servers
+    # Support both specific RTU ID and Broadcast/Standard IDs
+    store   = ModbusSlaveContext(hr=shared_block)
+    context = ModbusServerContext(slaves={RTU_SLAVE_ID: store, 255: store}, single=False)
 
-    # 2. Start TCP Server Thread (Passive reception of data)
-    # StartTcpServer is blocking, so it requires its own thread
-    t_tcp_srv = threading.Thread(target=run_tcp_server, args=(shared_block,), daemon=True)
-    t_tcp_srv.start()
+    # 1. Start Network Thread (Active polling of KSEM and passive reception of pushed data)
+    # Both run as tasks on one asyncio event loop
+    t_net = threading.Thread(target=run_network_thread, args=(shared_block, context), daemon=True)
+    t_net.start()
 
-    # 3. Start RTU Server (Main Thread)
+    # 2. Start RTU Server (Main Thread)
     # This call is blocking and keeps the script alive to serve Inverter requests
     try:
-        run_rtu_server(shared_block)
+        run_rtu_server(shared_block, context)
     except KeyboardInterrupt:
         print("[main] Script terminated by user.")
         sys.exit(0)
+    finally:
+        shared_block.close()
@@ -1,8 +1,10 @@
 """
 Modbus RTU Bridge - Fix: Frame Separation
-Verhindert das Zusammenkleben von Nachrichten durch erzwungene Pausen.
+Verhindert das Zusammenkleben von Nachrichten durch Frame-Erkennung über die Sendepause:
+ein Frame endet, sobald die Leitung für MODBUS_SILENT_INTERVAL ruhig ist (read_frame).
 """
 
+import selectors
 import serial
 import time
 import sys
@@ -24,8 +26,39 @@ SERIAL_PARAMS = {
 # Wir nutzen 4ms zur absoluten Sicherheit.
 MODBUS_SILENT_INTERVAL = 0.004 
 
+# Maximale Wartezeit auf das erste Byte der Antwort der Quelle
+RESPONSE_TIMEOUT = 0.3
+
+# Maximale Dauer eines Frames ab dem ersten Byte: doppelte Übertragungszeit eines
+# maximalen RTU-Frames (256 Bytes à 11 Bit bei 8N2, ca. 73ms bei 38400 Baud) als Reserve
+MAX_FRAME_TIME_NS = 2 * 256 * 11 * 1_000_000_000 // BAUDRATE
+
+# Frames als Hex-Dump auf der Konsole ausgeben
+HEX_LOG = True
+
+# Vorberechnete Hex-Darstellung aller Bytewerte
+_HEX = [f"{b:02X}" for b in range(256)]
+
 def hex_log(data):
-    return " ".join(f"{b:02X}" for b in data)
+    return " ".join(map(_HEX.__getitem__, data))
+
+def read_frame(port, sel, timeout):
+    # Blockiert (ohne Polling) bis das erste Byte anliegt (höchstens timeout) und liest
+    # dann weiter, bis die Leitung für MODBUS_SILENT_INTERVAL ruhig ist (= Frame-Ende).
+    # Mit timeout muss der Frame ab dem ersten Byte innerhalb von MAX_FRAME_TIME_NS
+    # komplett sein (Integer-Deadline auf monotonic_ns, unabhängig von der Systemzeit)
+    if not sel.select(timeout):
+        return b""
+    deadline = None if timeout is None else time.monotonic_ns() + MAX_FRAME_TIME_NS
+
+    frame = bytearray()
+    while True:
+        frame += port.read(port.in_waiting or 1)
+        if not sel.select(MODBUS_SILENT_INTERVAL):
+            return bytes(frame)
+        if deadline is not None and time.monotonic_ns() >= deadline:
+            # Leitung kommt nicht zur Ruhe: unvollständigen Frame verwerfen
+            return b""
 
 def run_bridge():
     try:
@@ -39,45 +72,39 @@ def run_bridge():
         print(f"[!] Fehler: {e}")
         return
 
+    # Auf den seriellen Dateideskriptoren warten statt in_waiting zu pollen
+    inv_sel = selectors.DefaultSelector()
+    inv_sel.register(inv, selectors.EVENT_READ)
+    src_sel = selectors.DefaultSelector()
+    src_sel.register(src, selectors.EVENT_READ)
+
     while True:
-        if inv.in_waiting > 0:
-            # 1. Anfrage vom Inverter lesen
-            time.sleep(0.01) # Kurz warten, um das ganze Paket zu erfassen
-            req = inv.read(inv.in_waiting)
-            
-            if req:
+        # 1. Anfrage vom Inverter lesen (wartet bis zum nächsten Frame)
+        req = read_frame(inv, inv_sel, None)
+
+        if req:
+            if HEX_LOG:
                 print(f"\n[INV ->] {hex_log(req)}")
-                
-                # 2. Weiterleiten an Quelle (vorher Buffer leeren)
-                src.reset_input_buffer()
-                src.write(req)
-                src.flush()
-                
-                # 3. Auf Antwort warten
-                resp = b""
-                start_time = time.time()
-                while (time.time() - start_time) < 0.3: # 300ms Fenster
-                    if src.in_waiting > 0:
-                        time.sleep(0.01) # Zeit geben damit Paket vollständig ankommt
-                        resp = src.read(src.in_waiting)
-                        break
-                
-                if resp:
+
+            # 2. Weiterleiten an Quelle (vorher Buffer leeren)
+            src.reset_input_buffer()
+            src.write(req)
+            src.flush()
+
+            # 3. Auf Antwort warten (300ms Fenster)
+            resp = read_frame(src, src_sel, RESPONSE_TIMEOUT)
+
+            if resp:
+                if HEX_LOG:
                     print(f"[-> SRC] Antwort: {hex_log(resp)}")
-                    
-                    # --- FIX: Paket-Trennung ---
-                    # Wir warten das Silent Interval, bevor wir senden
-                    time.sleep(MODBUS_SILENT_INTERVAL)
-                    
-                    inv.write(resp)
-                    inv.flush()
-                    
-                    # Erzwungene Pause nach dem Senden, damit der Bus zur Ruhe kommt
-                    time.sleep(MODBUS_SILENT_INTERVAL)
-                else:
-                    print("[!] Timeout von Quelle")
-
-        time.sleep(0.005)
+
+                # --- FIX: Paket-Trennung ---
+                # Beide Frames enden erst nach MODBUS_SILENT_INTERVAL Ruhe auf der Leitung,
+                # daher ist keine zusätzliche Pause vor oder nach dem Senden nötig
+                inv.write(resp)
+                inv.flush()
+            else:
+                print("[!] Timeout von Quelle")
 
 if __name__ == "__main__":
     run_bridge()